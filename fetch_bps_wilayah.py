@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 """Fetch Indonesian regional data from the BPS bridging API and emit SQL dumps.
 
-The script performs a breadth-first traversal across the supplied administrative
-levels, captures raw JSON responses, normalizes them into tabular records, and
-finally writes SQL statements that mirror the formatting of `data/wilayah.sql`.
-It can also query the BPS periode catalogue to list available snapshots or
-automatically pick the latest periode value.
+The script crawls the supplied administrative levels, requesting each level as
+soon as its parents arrive rather than level by level, captures raw JSON
+responses, normalizes them into tabular records, and finally writes SQL
+statements that mirror the formatting of `data/wilayah.sql`. It can also query
+the BPS periode catalogue to list available snapshots or automatically pick the
+latest periode value.
 
 Typical usage:
     python scripts/fetch_bps_wilayah.py \
@@ -20,22 +21,37 @@ The resulting artifacts are stored under `data/raw/bps/<periode>/`,
 from __future__ import annotations
 
 import argparse
-import csv
 import datetime as dt
-import json
+import os
+import platform
+import random
+import re
+import shutil
 import sys
+import threading
 import time
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from queue import SimpleQueue
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.exceptions import HTTPError as Urllib3HTTPError
 except ImportError as exc:  # pragma: no cover - defensive guard
     sys.stderr.write("error: requests library is required (pip install requests)\n")
     raise
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson only ships CPython builds
+    import json
+
+    orjson = None
+
 BASE_HEADERS = {
     "Accept": "*/*",
     "Accept-Language": "en-US,en;q=0.9",
@@ -54,8 +70,11 @@ BASE_HEADERS = {
 }
 
 LEVEL_ORDER = ["provinsi", "kabupaten", "kecamatan", "desa"]
+LEVEL_RANK = {level: idx for idx, level in enumerate(LEVEL_ORDER)}
 PERIODE_ENDPOINT = "https://sig.bps.go.id/rest-drop-down/getperiode"
 SQL_TABLE_NAME = "bps_wilayah"
+CSV_LINE_TERMINATOR = "\r\n"
+CSV_SPECIAL_CHARS = re.compile(r'[,"\r\n]')
 SQL_COLUMNS = [
     "kode_bps",
     "nama_bps",
@@ -72,9 +91,51 @@ class FetchError(RuntimeError):
     """Raised when the API repeatedly fails."""
 
 
-def log(message: str, verbose: bool) -> None:
+class RateLimiter:
+    """Token bucket shared by every crawl worker to cap the global request rate."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = max(1.0, capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_for = (1 - self._tokens) / self.rate
+            time.sleep(wait_for)
+
+
+def loads_json(data: bytes) -> object:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_json(obj: object, sort_keys: bool = False) -> bytes:
+    """Serialize to indented UTF-8 JSON, using orjson when it is available."""
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, ensure_ascii=False, indent=2, sort_keys=sort_keys).encode("utf-8")
+
+
+def log(verbose: bool, fmt: str, *args: object) -> None:
+    """Write a %-style message to stderr; formatting is skipped unless verbose."""
     if verbose:
-        sys.stderr.write(f"{message}\n")
+        sys.stderr.write((fmt % args if args else fmt) + "\n")
 
 
 def parse_args(argv: Optional[Iterable[str]] = None) -> argparse.Namespace:
@@ -108,7 +169,13 @@ def parse_args(argv: Optional[Iterable[str]] = None) -> argparse.Namespace:
         "--delay",
         type=float,
         default=0.25,
-        help="Seconds to sleep between requests to avoid hammering the API",
+        help="Seconds to sleep between periode catalogue retries",
+    )
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=0.0,
+        help="Cap on requests per second across all workers (0 = unlimited)",
     )
     parser.add_argument(
         "--timeout",
@@ -164,7 +231,7 @@ def parse_args(argv: Optional[Iterable[str]] = None) -> argparse.Namespace:
         "--workers",
         type=int,
         default=8,
-        help="Maximum concurrent requests per level",
+        help="Maximum concurrent requests across all levels",
     )
     return parser.parse_args(argv)
 
@@ -175,26 +242,54 @@ def normalize_levels(levels_str: str) -> List[str]:
     if unknown:
         raise ValueError(f"Unsupported levels supplied: {', '.join(unknown)}")
     # Preserve caller order but respect LEVEL_ORDER precedence
-    levels.sort(key=lambda lvl: LEVEL_ORDER.index(lvl))
+    levels.sort(key=LEVEL_RANK.__getitem__)
     return levels
 
 
-def build_headers(cookie: str) -> Dict[str, str]:
-    headers = dict(BASE_HEADERS)
+def parse_cookie_header(cookie: str) -> Dict[str, str]:
+    cookies: Dict[str, str] = {}
+    for part in cookie.split(";"):
+        name, sep, value = part.strip().partition("=")
+        if sep and name:
+            cookies[name] = value
+    return cookies
+
+
+def build_session(cookie: str, urls: Iterable[str], workers: int) -> requests.Session:
+    """Create a session whose connection pool can serve every worker at once."""
+    session = requests.Session()
+    pool_size = max(1, workers)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size * 2)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(BASE_HEADERS)
     if cookie:
-        headers["Cookie"] = cookie
-    return headers
+        cookies = parse_cookie_header(cookie)
+        # Scope cookies to each API host so a Set-Cookie refresh replaces them
+        # instead of being sent alongside the stale value.
+        for host in sorted({urlsplit(url).hostname or "" for url in urls}):
+            if "." not in host:
+                # http.cookiejar matches dotless hosts (e.g. localhost) as "<host>.local"
+                host += ".local"
+            for name, value in cookies.items():
+                session.cookies.set(name, value, domain=host, path="/")
+    return session
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for throttled or failing requests."""
+    return min(2 ** attempt, 30) + random.random()
 
 
 def fetch_level(
+    session: requests.Session,
     base_url: str,
     level: str,
     parent: str,
     periode_merge: str,
-    headers: Dict[str, str],
     timeout: float,
     retries: int,
-    delay: float,
+    limiter: Optional[RateLimiter],
     dry_run: bool,
     verbose: bool,
 ) -> List[Dict[str, str]]:
@@ -210,29 +305,52 @@ def fetch_level(
     last_exc = None
     for attempt in range(1, retries + 1):
         log(
-            f"Requesting level={level} parent={parent or '-'} attempt={attempt}",
             verbose,
+            "Requesting level=%s parent=%s attempt=%d",
+            level,
+            parent or "-",
+            attempt,
         )
+        if limiter is not None:
+            limiter.acquire()
         try:
-            response = requests.get(base_url, params=params, headers=headers, timeout=timeout)
-            response.raise_for_status()
+            response = session.get(base_url, params=params, timeout=timeout, stream=True)
             try:
-                payload = response.json()
+                response.raise_for_status()
+                # Read the body in one go straight off the socket instead of
+                # letting requests assemble .content from 10 KiB chunks.
+                body = response.raw.read(decode_content=True)
+            finally:
+                # Hand the connection back to the pool as soon as possible.
+                response.close()
+            try:
+                payload = loads_json(body)
             except ValueError as exc:  # pragma: no cover - network failure
                 raise FetchError(f"Invalid JSON for level={level} parent={parent}: {exc}")
             size = len(payload) if isinstance(payload, list) else "?"
             log(
-                f"Received {size} records for level={level} parent={parent or '-'}",
                 verbose,
+                "Received %s records for level=%s parent=%s",
+                size,
+                level,
+                parent or "-",
             )
             return payload
-        except requests.exceptions.RequestException as exc:
+        except (requests.exceptions.RequestException, Urllib3HTTPError) as exc:
             log(
-                f"Request failed for level={level} parent={parent or '-'}: {exc}",
                 verbose,
+                "Request failed for level=%s parent=%s: %s",
+                level,
+                parent or "-",
+                exc,
             )
             last_exc = exc
-            time.sleep(delay * attempt)
+            # Only back off when the server is throttling or unhealthy; other
+            # failures retry straight away through the shared rate limiter.
+            response = getattr(exc, "response", None)
+            status = response.status_code if response is not None else None
+            if attempt < retries and (status is None or status == 429 or status >= 500):
+                time.sleep(backoff_delay(attempt))
 
     raise FetchError(
         f"Failed to fetch level={level} parent={parent} after {retries} attempts"
@@ -242,7 +360,6 @@ def fetch_level(
 def fetch_periodes(
     session: requests.Session,
     periode_url: str,
-    headers: Dict[str, str],
     timeout: float,
     retries: int,
     delay: float,
@@ -255,21 +372,23 @@ def fetch_periodes(
 
     last_exc = None
     for attempt in range(1, retries + 1):
-        log(f"Requesting periode catalogue attempt={attempt}", verbose)
+        log(verbose, "Requesting periode catalogue attempt=%d", attempt)
         try:
-            response = session.get(periode_url, headers=headers, timeout=timeout)
+            response = session.get(periode_url, timeout=timeout)
             response.raise_for_status()
             try:
                 payload = response.json()
             except ValueError as exc:  # pragma: no cover
                 raise FetchError(f"Invalid JSON from periode endpoint: {exc}")
             size = len(payload) if isinstance(payload, list) else "?"
-            log(f"Received periode catalogue with {size} entries", verbose)
+            log(verbose, "Received periode catalogue with %s entries", size)
             return payload
         except requests.exceptions.RequestException as exc:
-            log(f"Request failed for periode catalogue: {exc}", verbose)
+            log(verbose, "Request failed for periode catalogue: %s", exc)
             last_exc = exc
-            time.sleep(delay * attempt)
+            # No point pausing once the final attempt has failed.
+            if attempt < retries:
+                time.sleep(delay * attempt)
 
     raise FetchError(f"Failed to fetch periodes after {retries} attempts") from last_exc
 
@@ -321,109 +440,138 @@ def extract_periode_values(raw_payload: object) -> List[str]:
 
 
 def crawl_hierarchy(
+    session: requests.Session,
     base_url: str,
     levels: List[str],
     periode_merge: str,
-    headers: Dict[str, str],
     timeout: float,
     retries: int,
-    delay: float,
+    max_rate: float,
     dry_run: bool,
     verbose: bool,
     workers: int,
-) -> Dict[str, List[Dict[str, Optional[str]]]]:
+) -> Tuple[
+    Dict[str, List[Dict[str, Optional[str]]]],
+    Dict[str, List[Dict[str, Optional[str]]]],
+    Dict[str, str],
+]:
     """Fetch all requested levels and attach parent relationships."""
-    collected: Dict[str, List[Dict[str, Optional[str]]]] = {level: [] for level in levels}
-    province_lookup: Dict[str, str] = {}
-    seen_codes: Dict[str, set[str]] = {level: set() for level in levels}
+    children: Dict[str, Dict[str, List[Dict[str, Optional[str]]]]] = {
+        level: {} for level in levels
+    }
+    # Codes whose children have already been queued; only guards against
+    # fetching the same subtree twice, not against duplicate records.
+    queued_codes: Dict[str, set[str]] = {level: set() for level in levels}
+    limiter = RateLimiter(max_rate) if max_rate > 0 else None
+    # Levels are pipelined: children are queued as soon as their parent's
+    # payload arrives, and finished futures are collected from a queue fed by
+    # done-callbacks rather than wait(), which rescans every pending future.
+    doneq: SimpleQueue[Future] = SimpleQueue()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+
+        def submit(idx: int, parent: str) -> Future:
+            future = executor.submit(
+                fetch_level,
+                session,
+                base_url,
+                levels[idx],
+                parent,
+                periode_merge,
+                timeout,
+                retries,
+                limiter,
+                dry_run,
+                verbose,
+            )
+            future.add_done_callback(doneq.put)
+            return future
 
+        pending: Dict[Future, Tuple[int, str]] = {submit(0, ""): (0, "")}
+        try:
+            while pending:
+                future = doneq.get()
+                idx, parent = pending.pop(future)
+                level = levels[idx]
+                try:
+                    payload = future.result()
+                except Exception as exc:  # propagate with context
+                    raise FetchError(
+                        f"Failed to fetch level={level} parent={parent}: {exc}"
+                    ) from exc
+
+                # Everything that only depends on the parent is hoisted out of
+                # the per-record loop.
+                queued = queued_codes[level]
+                parent_kode = parent or None
+                has_children = idx + 1 < len(levels)
+                records: List[Dict[str, Optional[str]]] = []
+                for item in payload:
+                    get = item.get
+                    kode_bps = get("kode_bps", "")
+                    kode_bps = (kode_bps if isinstance(kode_bps, str) else str(kode_bps)).strip()
+                    if not kode_bps or kode_bps == "0":
+                        log(
+                            verbose,
+                            "Skipping level=%s parent=%s with empty kode_bps",
+                            level,
+                            parent or "-",
+                        )
+                        continue
+                    records.append({
+                        "level": level,
+                        "kode_bps": kode_bps,
+                        "nama_bps": str(get("nama_bps", "")).strip(),
+                        "kode_dagri": str(get("kode_dagri", "")).strip(),
+                        "nama_dagri": str(get("nama_dagri", "")).strip(),
+                        "parent_kode_bps": parent_kode,
+                    })
+                    # Children are fetched by the code itself, so whichever
+                    # parent arrives first can queue them.
+                    if has_children and kode_bps not in queued:
+                        queued.add(kode_bps)
+                        pending[submit(idx + 1, kode_bps)] = (idx + 1, kode_bps)
+                children[level][parent] = records
+        except BaseException:
+            # Drop queued requests across all levels instead of letting the
+            # executor's shutdown(wait=True) run them before the error surfaces.
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    # Responses complete in arbitrary order; rebuild each level in parent order
+    # and dedup there, so the first parent in that order wins a duplicate code
+    # and the CSV, raw and SQL outputs stay deterministic between runs.
+    collected: Dict[str, List[Dict[str, Optional[str]]]] = {}
+    province_lookup: Dict[str, str] = {}
+    by_province: Dict[str, List[Dict[str, Optional[str]]]] = defaultdict(list)
+    province_names: Dict[str, str] = {}
     parents: List[str] = [""]
     for idx, level in enumerate(levels):
-        next_parents: List[str] = []
-        results: Dict[str, List[Dict[str, str]]] = {}
-
-        if dry_run or len(parents) == 1:
-            # Fall back to sequential to keep dry-run output readable or when only root.
-            for parent in parents:
-                results[parent] = fetch_level(
-                    base_url,
-                    level,
-                    parent,
-                    periode_merge,
-                    headers,
-                    timeout,
-                    retries,
-                    delay,
-                    dry_run,
-                    verbose,
-                )
-        else:
-            max_workers = max(1, workers)
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_map = {
-                    executor.submit(
-                        fetch_level,
-                        base_url,
-                        level,
-                        parent,
-                        periode_merge,
-                        headers,
-                        timeout,
-                        retries,
-                        delay,
-                        dry_run,
-                        verbose,
-                    ): parent
-                    for parent in parents
-                }
-                for future in as_completed(future_map):
-                    parent = future_map[future]
-                    try:
-                        payload = future.result()
-                    except Exception as exc:  # propagate with context
-                        raise FetchError(
-                            f"Failed to fetch level={level} parent={parent}: {exc}"
-                        ) from exc
-                    results[parent] = payload
-
+        rows: List[Dict[str, Optional[str]]] = []
+        seen: set[str] = set()
         for parent in parents:
-            payload = results.get(parent, [])
-            for item in payload:
-                kode_bps = str(item.get("kode_bps", "")).strip()
-                if not kode_bps or kode_bps == "0":
-                    log(
-                        f"Skipping level={level} parent={parent or '-'} with empty kode_bps",
-                        verbose,
-                    )
-                    continue
-                if kode_bps in seen_codes[level]:
+            parent_province = None if idx == 0 else province_lookup.get(parent, parent)
+            for record in children[level].get(parent, []):
+                kode_bps = record["kode_bps"]
+                if kode_bps in seen:
                     log(
-                        f"Skipping duplicate level={level} kode_bps={kode_bps}",
                         verbose,
+                        "Skipping duplicate level=%s kode_bps=%s",
+                        level,
+                        kode_bps,
                     )
                     continue
-                record = {
-                    "level": level,
-                    "kode_bps": kode_bps,
-                    "nama_bps": str(item.get("nama_bps", "")).strip(),
-                    "kode_dagri": str(item.get("kode_dagri", "")).strip(),
-                    "nama_dagri": str(item.get("nama_dagri", "")).strip(),
-                    "parent_kode_bps": parent or None,
-                }
-                seen_codes[level].add(kode_bps)
-                if idx == 0:
-                    province_lookup[kode_bps] = kode_bps
-                    record["province_kode_bps"] = kode_bps
-                else:
-                    record["province_kode_bps"] = province_lookup.get(parent, parent)
-                    province_lookup[kode_bps] = record["province_kode_bps"]
-                collected[level].append(record)
-                if idx + 1 < len(levels):
-                    next_parents.append(kode_bps)
-
-        parents = next_parents
-        time.sleep(delay)
-    return collected
+                seen.add(kode_bps)
+                province_code = parent_province or kode_bps
+                province_lookup[kode_bps] = province_code
+                record["province_kode_bps"] = province_code
+                rows.append(record)
+                by_province[province_code].append(record)
+                if level == "provinsi":
+                    province_names[province_code] = record["nama_bps"]
+        collected[level] = rows
+        parents = [row["kode_bps"] for row in rows]
+    return collected, by_province, province_names
 
 
 def ensure_output_dirs(raw_dir: Path, processed_dir: Path, sql_dir: Path, periode: str) -> Dict[str, Path]:
@@ -437,19 +585,27 @@ def ensure_output_dirs(raw_dir: Path, processed_dir: Path, sql_dir: Path, period
 
 def persist_raw(raw_root: Path, level: str, parents_payload: List[Dict[str, object]]) -> None:
     raw_file = raw_root / f"{level}.json"
-    raw_file.write_text(
-        json.dumps(
+    raw_file.write_bytes(
+        dumps_json(
             {
                 "level": level,
                 "fetched_at": dt.datetime.now(dt.timezone.utc).isoformat(),
                 "payloads": parents_payload,
-            },
-            ensure_ascii=False,
-            indent=2,
+            }
         )
     )
 
 
+def csv_field(value: Optional[str]) -> str:
+    """Format a value the way csv.writer does with the default excel dialect."""
+    if value is None:
+        return ""
+    text = str(value)
+    if CSV_SPECIAL_CHARS.search(text):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
 def persist_processed(processed_root: Path, level: str, rows: List[Dict[str, Optional[str]]], periode: str, fetched_at: str) -> None:
     processed_file = processed_root / f"{level}.csv"
     fieldnames = [
@@ -463,16 +619,17 @@ def persist_processed(processed_root: Path, level: str, rows: List[Dict[str, Opt
         "fetched_at",
         "province_kode_bps",
     ]
-    with processed_file.open("w", newline="", encoding="utf-8") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames)
-        writer.writeheader()
+    # periode_merge and fetched_at are identical on every row, so they are
+    # quoted once and spliced in between the per-row columns.
+    leading = fieldnames[:6]
+    shared = f",{csv_field(periode)},{csv_field(fetched_at)},"
+    with processed_file.open("w", newline="", encoding="utf-8", buffering=1 << 20) as handle:
+        handle.write(",".join(fieldnames) + CSV_LINE_TERMINATOR)
         for row in rows:
-            payload = dict(row)
-            payload.update({
-                "periode_merge": periode,
-                "fetched_at": fetched_at,
-            })
-            writer.writerow(payload)
+            handle.write(",".join([csv_field(row.get(name)) for name in leading]))
+            handle.write(shared)
+            handle.write(csv_field(row.get("province_kode_bps")))
+            handle.write(CSV_LINE_TERMINATOR)
 
 
 def write_manifest(processed_root: Path, periode: str, levels: List[str], counts: Dict[str, int], fetched_at: str, base_url: str) -> None:
@@ -483,8 +640,8 @@ def write_manifest(processed_root: Path, periode: str, levels: List[str], counts
         "counts": counts,
         "base_url": base_url,
     }
-    (processed_root / "manifest.json").write_text(
-        json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8"
+    (processed_root / "manifest.json").write_bytes(
+        dumps_json(manifest, sort_keys=True)
     )
 
 
@@ -495,12 +652,23 @@ def sql_escape(value: Optional[str]) -> str:
     return f"'{escaped}'"
 
 
+def record_sort_key(record: Dict[str, Optional[str]]) -> Tuple[int, str]:
+    """Order records by level depth first, then by kode_bps."""
+    return LEVEL_RANK.get(record["level"], len(LEVEL_ORDER)), record["kode_bps"]
+
+
 def render_sql(
-    all_records: List[Dict[str, Optional[str]]],
+    by_province: Dict[str, List[Dict[str, Optional[str]]]],
+    province_names: Dict[str, str],
     periode: str,
     levels: List[str],
     fetched_at: str,
-) -> str:
+) -> Iterator[str]:
+    """Yield the SQL dump as the header followed by one chunk per province.
+
+    Callers can write chunks as they are produced, so only one province's
+    INSERT statement is held in memory at a time.
+    """
     header_lines = [
         "/*",
         "BPS wilayah dump generated by scripts/fetch_bps_wilayah.py",
@@ -533,61 +701,59 @@ def render_sql(
         "",
     ]
 
-    # Group records by province for readability
-    by_province: Dict[str, List[Dict[str, Optional[str]]]] = defaultdict(list)
-    province_names: Dict[str, str] = {}
-    for record in all_records:
-        province_code = record.get("province_kode_bps") or record["kode_bps"]
-        by_province[province_code].append(record)
-        if record["level"] == "provinsi":
-            province_names[province_code] = record.get("nama_bps", province_code)
-    level_rank = {lvl: idx for idx, lvl in enumerate(LEVEL_ORDER)}
-
-    province_blocks: List[str] = []
+    # Each province's fragments go into one list that is joined once, and the
+    # per-dump constants are escaped once instead of for every row.
+    insert_line = "INSERT INTO bps_wilayah (" + ", ".join(SQL_COLUMNS) + ")\nVALUES\n"
+    row_suffix = ", " + sql_escape(periode) + ", " + sql_escape(fetched_at)
+    yield "\n".join(header_lines)
     for province_code in sorted(by_province.keys()):
         province_name = province_names.get(province_code, province_code)
         province_records = by_province[province_code]
-        province_records.sort(key=lambda rec: (level_rank.get(rec["level"], 99), rec["kode_bps"]))
-        lines = [f"-- Provinsi {province_name}", "INSERT INTO bps_wilayah (" + ", ".join(SQL_COLUMNS) + ")", "VALUES"]
-        tuples: List[str] = []
+        province_records.sort(key=record_sort_key)
+        out: List[str] = [f"\n-- Provinsi {province_name}\n", insert_line]
+        last = len(province_records) - 1
         for idx, record in enumerate(province_records):
-            values = [
+            out.append("(")
+            out.append(", ".join((
                 sql_escape(record.get("kode_bps")),
                 sql_escape(record.get("nama_bps")),
                 sql_escape(record.get("kode_dagri")),
                 sql_escape(record.get("nama_dagri")),
                 sql_escape(record.get("level")),
                 sql_escape(record.get("parent_kode_bps")),
-                sql_escape(periode),
-                sql_escape(fetched_at),
-            ]
-            tuple_str = f"({', '.join(values)})"
-            if idx + 1 < len(province_records):
-                tuple_str += ","
-            else:
-                tuple_str += ";"
-            tuples.append(tuple_str)
-        lines.extend(tuples)
-        province_blocks.append("\n".join(lines))
-        province_blocks.append("")
-
-    return "\n".join(header_lines + province_blocks)
-
-
-def flatten_records(collected: Dict[str, List[Dict[str, Optional[str]]]]) -> List[Dict[str, Optional[str]]]:
-    merged: List[Dict[str, Optional[str]]] = []
-    for level in LEVEL_ORDER:
-        rows = collected.get(level, [])
-        if rows:
-            merged.extend(rows)
-    return merged
+            )))
+            out.append(row_suffix)
+            out.append(");\n" if idx == last else "),\n")
+        yield "".join(out)
+
+
+def group_by_parent(rows: List[Dict[str, Optional[str]]]) -> List[Dict[str, object]]:
+    """Group a level's rows by parent for the raw payload archive."""
+    groups: Dict[str, List[Dict[str, Optional[str]]]] = defaultdict(list)
+    for row in rows:
+        groups[row.get("parent_kode_bps") or ""].append(row)
+    return [
+        {"parent_kode_bps": parent or None, "items": groups[parent]}
+        for parent in sorted(groups)
+    ]
+
+
+def write_sql(
+    sql_path: Path,
+    by_province: Dict[str, List[Dict[str, Optional[str]]]],
+    province_names: Dict[str, str],
+    periode: str,
+    levels: List[str],
+    fetched_at: str,
+) -> None:
+    with sql_path.open("w", encoding="utf-8") as handle:
+        handle.writelines(render_sql(by_province, province_names, periode, levels, fetched_at))
 
 
 def select_periode(
     raw_value: str,
     session: requests.Session,
     periode_url: str,
-    headers: Dict[str, str],
     timeout: float,
     retries: int,
     delay: float,
@@ -604,7 +770,6 @@ def select_periode(
         payload = fetch_periodes(
             session=session,
             periode_url=periode_url,
-            headers=headers,
             timeout=timeout,
             retries=retries,
             delay=delay,
@@ -614,7 +779,7 @@ def select_periode(
         periods = extract_periode_values(payload)
         if not periods:
             raise FetchError("No periode values returned; cannot continue")
-        log(f"Auto-selected latest periode: {periods[0]}", verbose)
+        log(verbose, "Auto-selected latest periode: %s", periods[0])
         return periods[0]
     return value
 
@@ -622,16 +787,14 @@ def select_periode(
 def main(argv: Optional[Iterable[str]] = None) -> None:
     args = parse_args(argv)
     levels = normalize_levels(args.levels)
-    headers = build_headers(args.cookie)
-    session = requests.Session()
+    session = build_session(args.cookie, [args.base_url, args.periode_url], args.workers)
     verbose = args.verbose
-    log(f"Levels to fetch: {', '.join(levels)}", verbose)
+    log(verbose, "Levels to fetch: %s", ", ".join(levels))
 
     if args.list_periodes:
         payload = fetch_periodes(
             session=session,
             periode_url=args.periode_url,
-            headers=headers,
             timeout=args.timeout,
             retries=args.max_retries,
             delay=args.delay,
@@ -651,14 +814,13 @@ def main(argv: Optional[Iterable[str]] = None) -> None:
         raw_value=args.periode_merge,
         session=session,
         periode_url=args.periode_url,
-        headers=headers,
         timeout=args.timeout,
         retries=args.max_retries,
         delay=args.delay,
         dry_run=args.dry_run,
         verbose=verbose,
     )
-    log(f"Using periode: {periode}", verbose)
+    log(verbose, "Using periode: %s", periode)
     fetched_at = dt.datetime.now(dt.timezone.utc).replace(microsecond=0).isoformat()
 
     sql_filename = (
@@ -677,14 +839,14 @@ def main(argv: Optional[Iterable[str]] = None) -> None:
         output_paths = ensure_output_dirs(
             args.raw_dir, args.processed_dir, args.sql_dir, periode
         )
-    collected = crawl_hierarchy(
+    collected, by_province, province_names = crawl_hierarchy(
+        session=session,
         base_url=args.base_url,
         levels=levels,
         periode_merge=periode,
-        headers=headers,
         timeout=args.timeout,
         retries=args.max_retries,
-        delay=args.delay,
+        max_rate=args.max_rate,
         dry_run=args.dry_run,
         verbose=verbose,
         workers=args.workers,
@@ -692,32 +854,17 @@ def main(argv: Optional[Iterable[str]] = None) -> None:
 
     counts = {level: len(collected[level]) for level in levels}
     for level, count in counts.items():
-        log(f"Collected {count} rows for level={level}", verbose)
+        log(verbose, "Collected %d rows for level=%s", count, level)
 
     for level in levels:
         # Persist raw payloads grouped by parent for traceability
         if not args.dry_run:
-            parent_payload = []
-            parents = sorted({row.get("parent_kode_bps") or "" for row in collected[level]})
-            for parent in parents:
-                parent_payload.append({
-                    "parent_kode_bps": parent or None,
-                    "items": [
-                        row
-                        for row in collected[level]
-                        if (row.get("parent_kode_bps") or "") == (parent or "")
-                    ],
-                })
-            persist_raw(output_paths["raw"], level, parent_payload)
+            persist_raw(output_paths["raw"], level, group_by_parent(collected[level]))
             persist_processed(output_paths["processed"], level, collected[level], periode, fetched_at)
 
     if not args.dry_run:
         write_manifest(output_paths["processed"], periode, levels, counts, fetched_at, args.base_url)
-
-    all_records = flatten_records(collected)
-    if not args.dry_run:
-        sql_content = render_sql(all_records, periode, levels, fetched_at)
-        sql_path.write_text(sql_content, encoding="utf-8")
+        write_sql(sql_path, by_province, province_names, periode, levels, fetched_at)
 
     summary_lines = [
         "BPS wilayah extraction completed.",
@@ -734,5 +881,22 @@ def main(argv: Optional[Iterable[str]] = None) -> None:
     sys.stdout.write("\n".join(summary_lines) + "\n")
 
 
+def reexec_under_pypy(argv: List[str]) -> None:
+    """Re-run this script under PyPy when PYPY_ACCEL=1 and pypy3 is installed.
+
+    The normalization loop, CSV writer and SQL renderer are plain dict/str
+    code that PyPy's JIT speeds up considerably. orjson has no PyPy build, so
+    the script falls back to the stdlib json module there.
+    """
+    if os.environ.get("PYPY_ACCEL") != "1" or platform.python_implementation() == "PyPy":
+        return
+    pypy = shutil.which("pypy3")
+    if not pypy:
+        sys.stderr.write("warning: PYPY_ACCEL=1 but pypy3 was not found; using CPython\n")
+        return
+    os.execv(pypy, [pypy, str(Path(__file__).resolve()), *argv])
+
+
 if __name__ == "__main__":
+    reexec_under_pypy(sys.argv[1:])
     main()